@@ -1,5 +1,11 @@
+import os
+import pickle
+import subprocess
+import sys
+import weakref
 from datetime import datetime, timezone
 from decimal import Decimal
+from pathlib import Path
 from uuid import UUID
 
 import pytest
@@ -10,6 +16,7 @@ from prompt_template import (
     TemplateError,
     TemplateSerializationError,
 )
+from prompt_template.prompt_template import MAX_COMPILED_PLACEHOLDERS
 
 
 def test_basic_variable_substitution() -> None:
@@ -26,6 +33,27 @@ def test_multiple_variables() -> None:
     assert result == "Hello Alice! How is London?"
 
 
+def test_repeated_variables() -> None:
+    """Test that every occurrence of a variable is substituted."""
+    template = PromptTemplate("${name}, ${greeting} ${name}!")
+    assert template.variables == {"name", "greeting"}
+    assert template.to_string(name="Alice", greeting="Hi") == "Alice, Hi Alice!"
+
+
+def test_substituted_values_are_not_rescanned() -> None:
+    """Test that values containing variable declarations are inserted verbatim."""
+    template = PromptTemplate("${first} ${second}")
+    assert template.to_string(first="${second}", second="value") == "${second} value"
+
+
+def test_template_with_many_placeholders() -> None:
+    """Test rendering templates on both sides of the generated renderer's placeholder limit."""
+    for count in (MAX_COMPILED_PLACEHOLDERS, MAX_COMPILED_PLACEHOLDERS + 1):
+        template = PromptTemplate(" '\\n' ".join(f"${{var{index % 7}}}" for index in range(count)))
+        expected = " '\\n' ".join(f"value{index % 7}" for index in range(count))
+        assert template.to_string(**{f"var{index}": f"value{index}" for index in range(7)}) == expected
+
+
 def test_json_with_variables() -> None:
     """Test template with JSON structure and variables."""
     template = PromptTemplate("""
@@ -42,6 +70,23 @@ def test_json_with_variables() -> None:
     assert '"city": "New York"' in result
 
 
+def test_rendered_output_is_dedented() -> None:
+    """Test that common indentation is removed whether it comes from the template or the values."""
+    assert PromptTemplate("\n    Hello\n      ${name}!\n").to_string(name="World") == "Hello\n  World!"
+    assert PromptTemplate("${text}").to_string(text="  first\n    second") == "first\n  second"
+    assert PromptTemplate("Hello\n${name}!").to_string(name="World") == "Hello\nWorld!"
+
+
+def test_template_without_variables() -> None:
+    """Test rendering and substituting a template that has no variables."""
+    template = PromptTemplate("\n    You are a helpful assistant.\n    ", name="system")
+    assert template.to_string() == "You are a helpful assistant."
+    assert template.substitute() == PromptTemplate(template.template, name="system_substitution")
+
+    with pytest.raises(InvalidTemplateKeysError):
+        template.to_string(name="value")
+
+
 def test_missing_variables() -> None:
     """Test error when variables are missing."""
     template = PromptTemplate("Hello ${name}!")
@@ -75,6 +120,15 @@ def test_nested_braces() -> None:
     assert '"value": "nested_value"' in result
 
 
+def test_deeply_nested_braces() -> None:
+    """Test that brace nesting depth is not limited."""
+    template = PromptTemplate("{" * 100 + "${value}" + "}" * 100)
+    assert template.to_string(value="x") == "{" * 100 + "x" + "}" * 100
+
+    with pytest.raises(TemplateError, match="Unclosed brace"):
+        PromptTemplate("{" * 100 + "}" * 99)
+
+
 def test_escaping() -> None:
     """Test escaping of special characters."""
     cases = [
@@ -83,6 +137,7 @@ def test_escaping() -> None:
         ('{"key": "${var}"}', {"var"}),  # Normal variable
         ('{"key": "\\\\${var}"}', {"var"}),  # Escaped backslash
         ('{"key": "\\{not_var}"}', set()),  # Escaped brace
+        ('\\n{"key": "${var}"}', {"var"}),  # Backslash before a brace
     ]
 
     for template_str, expected_vars in cases:
@@ -90,6 +145,13 @@ def test_escaping() -> None:
         assert template.variables == expected_vars
 
 
+def test_escaped_variables_are_not_substituted() -> None:
+    """Test that escaped variable declarations are rendered verbatim."""
+    template = PromptTemplate("${var} \\${var}")
+    assert template.to_string(var="value") == "value \\${var}"
+    assert template.substitute(var="value").template == "value \\${var}"
+
+
 def test_template_validation_errors() -> None:
     """Test various template validation error cases."""
     error_cases = [
@@ -100,6 +162,8 @@ def test_template_validation_errors() -> None:
         ("${123name}", "Invalid variable name"),
         ("${invalid@name}", "Invalid variable name"),
         ("{unclosed", "Unclosed brace"),
+        ('{"a": {"b": 1}', "Unclosed brace"),
+        ('{"a": 1}}', "Unmatched closing brace"),
     ]
 
     for template_str, expected_error in error_cases:
@@ -108,6 +172,22 @@ def test_template_validation_errors() -> None:
         assert expected_error in str(exc_info.value)
 
 
+def test_template_validation_error_includes_name() -> None:
+    """Test that validation errors are reported with the template name."""
+    with pytest.raises(TemplateError) as exc_info:
+        PromptTemplate("Hello ${", name="broken")
+    assert "[Template: broken] Unclosed variable declaration" in str(exc_info.value)
+    assert exc_info.value.template_name == "broken"
+
+
+def test_template_parsing_is_cached() -> None:
+    """Test that templates with the same source share the parsed structure."""
+    template1 = PromptTemplate("Hello ${name} from ${place}!", name="first")
+    template2 = PromptTemplate("Hello ${name} from ${place}!", name="second")
+    assert template1._parts is template2._parts  # noqa: SLF001
+    assert template2.to_string(name="Alice", place="London") == "Hello Alice from London!"
+
+
 def test_valid_variable_names() -> None:
     """Test valid variable name patterns."""
     valid_cases = [
@@ -315,6 +395,37 @@ def test_set_default_multiple() -> None:
     assert result == "Hi Bob! How is London?"
 
 
+def test_set_defaults_from_mapping() -> None:
+    """Test setting defaults from a mapping and keyword arguments in one call."""
+    template = PromptTemplate("${greeting} ${name}! How is ${location}?")
+    template.set_defaults({"greeting": "Hello", "name": "Alice"}, name="Bob", location="London")
+    assert template.to_string() == "Hello Bob! How is London?"
+
+    with pytest.raises(InvalidTemplateKeysError) as exc_info:
+        template.set_defaults({"greeting": "Hi", "invalid_key": "Value"})
+    assert exc_info.value.invalid_keys == ["invalid_key"]
+    assert template.to_string() == "Hello Bob! How is London?"
+
+
+def test_set_defaults_non_string_keys() -> None:
+    """Test that non-string keys in a defaults mapping are reported as invalid keys."""
+    template = PromptTemplate("${b}")
+
+    with pytest.raises(InvalidTemplateKeysError) as exc_info:
+        template.set_defaults({1: "x"})  # type: ignore[dict-item]
+    assert exc_info.value.invalid_keys == [1]  # type: ignore[comparison-overlap]
+    assert "Invalid keys provided to PromptTemplate: 1" in str(exc_info.value)
+
+    with pytest.raises(InvalidTemplateKeysError) as exc_info:
+        template.set_defaults({1: "x", "b": 2})  # type: ignore[dict-item]
+    assert exc_info.value.invalid_keys == [1]  # type: ignore[comparison-overlap]
+
+    with pytest.raises(InvalidTemplateKeysError) as exc_info:
+        template.set_defaults({1: "x", "c": 2})  # type: ignore[dict-item]
+    assert exc_info.value.invalid_keys == [1, "c"]
+    assert template.to_string(b="value") == "value"
+
+
 def test_mutable_default_safety() -> None:
     """Test that mutable defaults are properly deep copied."""
     template = PromptTemplate("${config}")
@@ -415,7 +526,7 @@ def test_default_value_serialization() -> None:
     assert "42" in result
     assert "3.14" in result
     assert "550e8400-e29b-41d4-a716-446655440000" in result
-    assert "binary data" in result or "YmluYXJ5IGRhdGE=" in result  # base64 encoded if can't decode
+    assert "binary data" in result
 
 
 def test_template_equality_with_defaults() -> None:
@@ -430,6 +541,15 @@ def test_template_equality_with_defaults() -> None:
     assert template1 == template2
 
 
+def test_template_uses_slots() -> None:
+    """Test that template instances don't carry a per-instance __dict__."""
+    template = PromptTemplate("Hello ${name}!")
+    assert not hasattr(template, "__dict__")
+    assert weakref.ref(template)() is template
+    with pytest.raises(AttributeError):
+        template.unknown = "value"  # type: ignore[attr-defined]
+
+
 def test_template_constructor_validation() -> None:
     """Test validation of constructor arguments."""
     with pytest.raises(TypeError, match="template must be a string"):
@@ -487,6 +607,7 @@ def test_serializer_edge_cases() -> None:
     """Test edge cases in the serializer method."""
     # Test bytes serialization with different encodings
     assert PromptTemplate.serializer(b"hello") == "hello"  # UTF-8 decodable
+    assert PromptTemplate.serializer("héllo".encode()) == "héllo"  # Non-ASCII UTF-8
     assert PromptTemplate.serializer(b"\xff\xff") == "ÿÿ"  # Latin1 fallback
 
     # Test various Python types
@@ -496,6 +617,40 @@ def test_serializer_edge_cases() -> None:
     assert PromptTemplate.serializer([1, 2, 3]) == "[1, 2, 3]"
 
 
+def test_serializer_subclasses() -> None:
+    """Test that subclasses of specially handled types are serialized like their base types."""
+
+    class CustomStr(str):
+        __slots__ = ()
+
+    class CustomDatetime(datetime):
+        pass
+
+    class CustomDecimal(Decimal):
+        pass
+
+    class CustomUUID(UUID):
+        pass
+
+    class CustomBytes(bytes):
+        pass
+
+    assert PromptTemplate.serializer(CustomStr("hello")) == "hello"
+    assert PromptTemplate.serializer(CustomDatetime(2024, 1, 1, 12, 0)) == "2024-01-01T12:00:00"
+    assert PromptTemplate.serializer(CustomDecimal("3.14")) == "3.14"
+    assert (
+        PromptTemplate.serializer(CustomUUID("550e8400-e29b-41d4-a716-446655440000"))
+        == "550e8400-e29b-41d4-a716-446655440000"
+    )
+    assert PromptTemplate.serializer(CustomBytes(b"hello")) == "hello"
+
+
+def test_serializer_fast_path_errors() -> None:
+    """Test that failures in the per-type serializers are raised as TypeError."""
+    with pytest.raises(TypeError, match="Could not serialize value of type <class 'int'>"):
+        PromptTemplate.serializer(10**5000)
+
+
 def test_prepare_edge_cases() -> None:
     """Test edge cases in prepare method."""
     template = PromptTemplate("${var}")
@@ -534,6 +689,57 @@ def test_template_equality_edge_cases() -> None:
     assert hash(template1) != hash(template3)
 
 
+def test_template_is_immutable() -> None:
+    """Test that the name and template string can't be reassigned after construction."""
+    template = PromptTemplate("Hello ${name}!", name="greeting")
+    with pytest.raises(AttributeError):
+        template.name = "other"  # type: ignore[misc]
+    with pytest.raises(AttributeError):
+        template.template = "Bye ${name}!"  # type: ignore[misc]
+    assert hash(template) == hash(PromptTemplate("Hello ${name}!", name="greeting"))
+    assert {template: "cached"}[PromptTemplate("Hello ${name}!", name="greeting")] == "cached"
+
+
+def test_template_pickle_round_trip() -> None:
+    """Test that templates can be pickled after they have been rendered."""
+    template = PromptTemplate("Hello ${name} from ${place}!", name="greeting")
+    template.set_default(place="London")
+    assert template.to_string(name="Alice") == "Hello Alice from London!"
+
+    restored = pickle.loads(pickle.dumps(template))
+    assert restored == template
+    assert restored.to_string(name="Bob") == "Hello Bob from London!"
+
+
+def test_template_pickle_across_hash_seeds() -> None:
+    """Test that templates unpickled in another process hash like templates created there."""
+
+    def run(code: str, hash_seed: str, stdin: bytes = b"") -> bytes:
+        env = {**os.environ, "PYTHONHASHSEED": hash_seed, "PYTHONPATH": str(Path(__file__).parent.parent)}
+        return subprocess.run(
+            [sys.executable, "-c", code], input=stdin, env=env, capture_output=True, check=True
+        ).stdout
+
+    pickled = run(
+        "import pickle, sys\n"
+        "from prompt_template import PromptTemplate\n"
+        "template = PromptTemplate('Hello ${name}!', name='greeting')\n"
+        "template.set_default(name='World')\n"
+        "sys.stdout.buffer.write(pickle.dumps(template))\n",
+        "1",
+    )
+    output = run(
+        "import pickle, sys\n"
+        "from prompt_template import PromptTemplate\n"
+        "restored = pickle.loads(sys.stdin.buffer.read())\n"
+        "fresh = PromptTemplate('Hello ${name}!', name='greeting')\n"
+        "print(restored in {fresh: 1}, len({restored, fresh}), restored.to_string())\n",
+        "2",
+        pickled,
+    )
+    assert output.decode().split() == ["True", "1", "Hello", "World!"]
+
+
 def test_template_equality_different_types() -> None:
     """Test template equality with different types."""
     template = PromptTemplate("test")